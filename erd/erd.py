@@ -1,31 +1,304 @@
+import os
 import re
 import json
+import pickle
+import hashlib
+import tempfile
 from types import FunctionType
 from dataclasses import dataclass
+from functools import cached_property
 from typing import Optional
 
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+try:
+    import ijson
+except ImportError:
+    ijson = None
+
+LEADING_NON_ALPHA = re.compile("^[^a-zA-Z]+")
+NON_IDENTIFIER = re.compile("[^a-zA-Z0-9_]+")
+INDENT = 4
+TAB = " " * INDENT
+
+CACHE_DIR = os.path.join(
+    os.environ.get("XDG_CACHE_HOME", os.path.join(os.path.expanduser("~"), ".cache")),
+    "dbt-mermaid"
+)
+CACHE_VERSION = 1
+CACHE_DIGEST_SIZE = 32
+CACHED_ATTRIBUTES = (
+    "nodes",
+    "_nodes_by_type",
+    "_tests_by_type",
+    "_tests_by_model",
+    "_tests_by_model_and_type",
+    "_columns_by_model_and_type",
+)
+
+
+def clean_property(value: str) -> str:
+    """Clean a property according to mermaid specifications"""
+    return NON_IDENTIFIER.sub("_", LEADING_NON_ALPHA.sub("", value))
+
+
+def slim_node(node: dict) -> dict:
+    """Keep only the properties of a manifest node that are used to draw the ERD"""
+    slim = {"name": node["name"], "resource_type": node["resource_type"]}
+    if "depends_on" in node:
+        slim["depends_on"] = {"nodes": node["depends_on"].get("nodes", [])}
+    test_metadata = node.get("test_metadata")
+    if test_metadata:
+        kwargs = test_metadata.get("kwargs", {})
+        slim["test_metadata"] = {
+            "name": test_metadata.get("name"),
+            "kwargs": {k: kwargs[k] for k in ("column_name", "field") if k in kwargs}
+        }
+    return slim
+
+
+def load_json(path: str) -> dict:
+    """Load a JSON file, using orjson when it's available"""
+    if orjson is None:
+        with open(path, 'r') as f:
+            return json.load(f)
+    with open(path, 'rb') as f:
+        return orjson.loads(f.read())
+
+
+def iter_nodes(path: str):
+    """Stream the nodes of a dbt artifact as (unique id, properties) pairs"""
+    with open(path, 'rb') as f:
+        yield from ijson.kvitems(f, "nodes", use_float=True)
+
 
 @dataclass
 class Dbt:
     """
-    This class represents a dbt project from its manifest and catalog
+    This class represents a dbt project from its manifest and catalog.
+    With `cache`, the manifest nodes only keep the properties used to draw
+    the ERD.
     """
     manifest_path: str
     catalog_path: Optional[str] = ""
+    select: Optional[tuple] = None
+    low_memory: bool = False
+    cache: bool = False
 
     def __post_init__(self):
-        self.load_manifest()
+        self._model_cache = {}
+        self._test_cache = {}
+        self._column_cache = {}
+        cached = self.load_cache() if self.cache else None
+        if cached:
+            for attribute, value in cached.items():
+                setattr(self, attribute, value)
+            self.manifest = {"nodes": self.nodes}
+        else:
+            self.load_manifest()
+            self.index_nodes()
+            self.index_tests()
+            if self.cache:
+                self.dump_cache()
 
-        if self.catalog_path:
-            self.load_catalog()
+    @property
+    def cache_path(self) -> str:
+        """
+        The path of the cache for the manifest. Each new version of the
+        manifest overwrites the same cache.
+        """
+        key = hashlib.blake2b(os.path.abspath(self.manifest_path).encode()).hexdigest()
+        return os.path.join(CACHE_DIR, key)
+
+    @property
+    def cache_stamp(self) -> Optional[tuple]:
+        """
+        What identifies the current version of the manifest, or None when it
+        can't be cached (e.g. a pipe)
+        """
+        if not os.path.isfile(self.manifest_path):
+            return None
+        stat = os.stat(self.manifest_path)
+        return (CACHE_VERSION, stat.st_mtime_ns, stat.st_size)
+
+    def load_cache(self) -> Optional[dict]:
+        """
+        Load the nodes and indexes from the cache. Returns None on a miss,
+        including when the cache can't be read.
+        """
+        stamp = self.cache_stamp
+        if stamp is None:
+            return None
+        try:
+            with open(self.cache_path, 'rb') as f:
+                digest = f.read(CACHE_DIGEST_SIZE)
+                payload = f.read()
+            if hashlib.blake2b(payload, digest_size=CACHE_DIGEST_SIZE).digest() != digest:
+                return None
+            cached = pickle.loads(payload)
+            if (isinstance(cached, dict) and cached.get("stamp") == stamp
+                    and isinstance(cached.get("data"), dict)
+                    and set(cached["data"]) == set(CACHED_ATTRIBUTES)):
+                return cached["data"]
+        except Exception:
+            pass
+        return None
+
+    def dump_cache(self):
+        """Save the nodes and indexes to the cache"""
+        stamp = self.cache_stamp
+        if stamp is None:
+            return
+        payload = pickle.dumps({
+            "stamp": stamp,
+            "data": {attribute: getattr(self, attribute) for attribute in CACHED_ATTRIBUTES},
+        }, protocol=pickle.HIGHEST_PROTOCOL)
+        temp_path = None
+        try:
+            os.makedirs(CACHE_DIR, exist_ok=True)
+            with tempfile.NamedTemporaryFile(dir=CACHE_DIR, delete=False) as f:
+                temp_path = f.name
+                # The digest lets a corrupted cache be detected before unpickling it
+                f.write(hashlib.blake2b(payload, digest_size=CACHE_DIGEST_SIZE).digest())
+                f.write(payload)
+            os.replace(temp_path, self.cache_path)
+        except OSError:
+            if temp_path and os.path.exists(temp_path):
+                os.remove(temp_path)
+
+    @property
+    def streaming(self) -> bool:
+        """
+        Whether to stream only the selected nodes from the manifest and
+        catalog. It lowers the memory used, but isn't faster than orjson.
+        The cache is faster and small, so it's never combined with streaming.
+        """
+        return bool(self.select) and self.low_memory and not self.cache and ijson is not None
 
     def load_manifest(self):
-        with open(self.manifest_path, 'r') as f:
-            self.manifest = json.load(f)
+        """
+        Load the manifest. When streaming, only the tests and the selected
+        models are loaded. When caching, only the properties in the cache
+        are kept, whether the cache is hit or not.
+        """
+        if self.streaming:
+            self.manifest = {"nodes": self.stream_manifest()}
+        elif self.cache:
+            nodes = load_json(self.manifest_path)["nodes"]
+            self.manifest = {"nodes": {k: slim_node(node) for k, node in nodes.items()}}
+        else:
+            self.manifest = load_json(self.manifest_path)
+        self.nodes = self.manifest["nodes"]
+
+    def stream_manifest(self) -> dict:
+        """Stream the tests and the selected models from the manifest"""
+        names = set(self.get_name_from_path(self.select))
+        nodes = {}
+        other_models = {}
+        for k, node in iter_nodes(self.manifest_path):
+            resource_type = node["resource_type"]
+            if resource_type == "test" or (resource_type == "model" and node["name"] in names):
+                nodes[k] = node
+            elif resource_type == "model":
+                # Enough to draw it, in case a selected relationship points to it
+                other_models[k] = {"name": node["name"], "resource_type": resource_type}
+
+        # Selected relationships may point to models outside the selection
+        for node in list(nodes.values()):
+            if node["resource_type"] == "test" and node["name"] in names:
+                for unique_id in node["depends_on"]["nodes"]:
+                    if unique_id in other_models:
+                        nodes[unique_id] = other_models[unique_id]
+        return nodes
+
+    def load_catalog(self) -> dict:
+        """
+        Load the catalog. When streaming, only the loaded models are kept.
+        """
+        if not self.streaming:
+            self.catalog = load_json(self.catalog_path)
+        else:
+            self.catalog = {"nodes": {k: node for k, node in iter_nodes(self.catalog_path)
+                                      if k in self.nodes}}
+        self.catalog_nodes = self.catalog["nodes"]
+        return self.catalog
+
+    @cached_property
+    def catalog(self) -> dict:
+        """The catalog, which is only loaded when the fields are needed"""
+        return self.load_catalog()
+
+    @cached_property
+    def catalog_nodes(self) -> dict:
+        return self.catalog["nodes"]
+
+    def resolve_nodes(self, nodes):
+        """
+        Get the nodes to draw, which default to `select`. When streaming,
+        only the selected nodes were loaded, so they can't be extended.
+        """
+        if not nodes:
+            return self.select or nodes
+        if self.streaming and not set(nodes) <= set(self.select):
+            raise ValueError(
+                "Only the selected nodes were loaded, "
+                f"these aren't part of the selection: {sorted(set(nodes) - set(self.select))}"
+            )
+        return nodes
 
-    def load_catalog(self):
-        with open(self.catalog_path, 'r') as f:
-            self.catalog = json.load(f)
+    def index_nodes(self):
+        """Index the nodes by resource type (model, test, etc.)"""
+        self._nodes_by_type = {}
+        for k, node in self.nodes.items():
+            self._nodes_by_type.setdefault(node["resource_type"], {})[k] = node
+
+    def index_tests(self):
+        """
+        Index the tests by type, by the model they test, and by the model
+        they test and their type, along with the columns they test
+        """
+        self._tests_by_type = {}
+        self._tests_by_model = {}
+        self._tests_by_model_and_type = {}
+        self._columns_by_model_and_type = {}
+        for k, node in self._nodes_by_type.get("test", {}).items():
+            test_metadata = node.get("test_metadata", {})
+            test_type = test_metadata.get("name")
+            column_name = test_metadata.get("kwargs", {}).get("column_name")
+            self._tests_by_type.setdefault(test_type, []).append(k)
+            for unique_id in node["depends_on"]["nodes"]:
+                self._tests_by_model.setdefault(unique_id, []).append(k)
+                key = (unique_id, test_type)
+                self._tests_by_model_and_type.setdefault(key, []).append(k)
+                self._columns_by_model_and_type.setdefault(key, set()).add(column_name)
+        self._columns_by_model_and_type = {
+            key: frozenset(columns) for key, columns in self._columns_by_model_and_type.items()
+        }
+
+    def model(self, unique_id: str) -> "Model":
+        """Get a model, creating it only the first time it's requested"""
+        model = self._model_cache.get(unique_id)
+        if model is None:
+            model = self._model_cache[unique_id] = Model(unique_id, self)
+        return model
+
+    def test(self, unique_id: str) -> "Test":
+        """Get a test, creating it only the first time it's requested"""
+        test = self._test_cache.get(unique_id)
+        if test is None:
+            test = self._test_cache[unique_id] = Test(unique_id, self)
+        return test
+
+    def column(self, name: str, model: "Model") -> "Column":
+        """Get a column of a model, creating it only the first time it's requested"""
+        key = (model.unique_id, name)
+        column = self._column_cache.get(key)
+        if column is None:
+            column = self._column_cache[key] = Column(name, model)
+        return column
 
     def get_nodes_by_type(
         self,
@@ -40,15 +313,16 @@ class Dbt:
             filter: A function that takes the properties of a node and
                     returns True for selected models
         """
-        node_classes = {
-            "model": Model,
-            "test": Test
+        node_getters = {
+            "model": self.model,
+            "test": self.test
         }
-        node_class = node_classes.get(resource_type, Node)
-        nodes = {k: node_class(k, self) for k, node in self.manifest["nodes"].items()
-                 if node["resource_type"] == resource_type}
-        if filter:
-            nodes = {k: node for k, node in nodes.items() if filter(node)}
+        get_node = node_getters.get(resource_type, lambda k: Node(k, self))
+        nodes = {}
+        for k in self._nodes_by_type.get(resource_type, {}):
+            node = get_node(k)
+            if not filter or filter(node):
+                nodes[k] = node
 
         return nodes
 
@@ -56,43 +330,38 @@ class Dbt:
         """
         Get tests of a certain type (relationships, unique, not_null, etc.)
         """
-        return {k: test for k, test in self.tests().items()
-                if test.get("test_metadata", {}).get("name") == test_type}
+        return {k: self.test(k) for k in self._tests_by_type.get(test_type, [])}
 
     @property
     def tests(self):
-        tests = self.get_nodes_by_type("test")
-        return {k: Test(k, self) for k in tests}
+        return self.get_nodes_by_type("test")
 
     @staticmethod
     def get_name_from_path(nodes):
         return [node.split(".")[-1] for node in nodes]
 
     def relationships(self, nodes=None):
-        if nodes:
-            return {k: RelationshipTest(k, self) for k, node in self.tests.items()
-                    if node.is_relationship and node["name"] in nodes}
-        return {k: RelationshipTest(k, self) for k, node in self.tests.items()
-            if node.is_relationship}
+        return {k: RelationshipTest(k, self) for k in self._tests_by_type.get("relationships", [])
+                if not nodes or self.nodes[k]["name"] in nodes}
 
     def models(self, nodes=None):
-        return self.get_nodes_by_type("model", lambda model: not nodes or model["name"] in nodes)
+        return {k: self.model(k) for k, node in self._nodes_by_type.get("model", {}).items()
+                if not nodes or node["name"] in nodes}
 
     def get_mermaid(self, nodes=None, show_fields=False):
         """Get the mermaid code for the ERD"""
-        unique_ids = self.get_name_from_path(nodes)
-        mermaid_lines = ["erDiagram"]
-        mermaid_relationships_list = [relationship.get_mermaid()
-                                      for relationship
-                                      in self.relationships(unique_ids).values()]
-        mermaid_lines += mermaid_relationships_list
+        return "\n".join(self.iter_mermaid(nodes, show_fields))
+
+    def iter_mermaid(self, nodes=None, show_fields=False):
+        """Get the mermaid code for the ERD, one line at a time"""
+        names = set(self.get_name_from_path(self.resolve_nodes(nodes) or ()))
+        yield "erDiagram"
+        for relationship in self.relationships(names).values():
+            yield relationship.get_mermaid()
 
         if show_fields:
-            catalog_mermaid_list = [model.get_mermaid() for model in self.models(unique_ids).values()]
-            mermaid_catalog = "\n".join(catalog_mermaid_list)
-            mermaid_lines.append(mermaid_catalog)
-        mermaid = "\n".join(mermaid_lines)
-        return mermaid
+            for model in self.models(names).values():
+                yield from model.iter_mermaid()
 
 
 @dataclass
@@ -100,24 +369,29 @@ class Node:
     """
     A class to represent a node (model, test, etc.) in the manifest.
     """
+    __slots__ = ("unique_id", "project", "_props")
+
     unique_id: str
     project: Dbt
 
     def __post_init__(self):
+        self._props = self.project.nodes[self.unique_id]
         if not self.validate():
             raise ValueError("Error validating this node")
 
     def __getitem__(self, key: str) -> any:
-        return self.project.manifest["nodes"][self.unique_id].get(key)
+        return self._props.get(key)
 
     def get(self, key, default=None):
-        return self.project.manifest["nodes"][self.unique_id].get(key, default)
+        return self._props.get(key, default)
 
     def validate(self):
         return True
 
 
 class Test(Node):
+    __slots__ = ()
+
     def validate(self):
         return self["resource_type"] == "test"
 
@@ -135,10 +409,18 @@ class Test(Node):
 
 
 class RelationshipTest(Test):
+    __slots__ = ("_models",)
+
+    def __post_init__(self):
+        self._models = None
+        super().__post_init__()
+
     @property
     def models(self):
-        return [Model(unique_id, self.project)
-                for unique_id in self["depends_on"]["nodes"]]
+        if self._models is None:
+            self._models = [self.project.model(unique_id)
+                            for unique_id in self["depends_on"]["nodes"]]
+        return self._models
 
     @property
     def model_a(self):
@@ -150,14 +432,14 @@ class RelationshipTest(Test):
 
     @property
     def foreign_key(self):
-        return Column(
+        return self.project.column(
             self["test_metadata"]["kwargs"]["column_name"],
             self.model_b
         )
 
     @property
     def to(self):
-        return Column(
+        return self.project.column(
             self["test_metadata"]["kwargs"]["field"],
             self.model_a
         )
@@ -181,52 +463,76 @@ class RelationshipTest(Test):
 @dataclass
 class Model(Node):
     """A class to represent a model node in the dbt manifest"""
+    __slots__ = ("_unique_columns", "_not_null_columns")
+
     unique_id: str
     project: Dbt
 
+    def __post_init__(self):
+        self._unique_columns = None
+        self._not_null_columns = None
+        super().__post_init__()
+
     @property
     def catalog(self):
-        return self.project.catalog["nodes"][self.unique_id]
+        return self.project.catalog_nodes[self.unique_id]
 
     @property
     def columns(self) -> dict:
-        return {name: Column(name, self) for name in self.catalog["columns"]}
+        return {name: self.project.column(name, self) for name in self.catalog["columns"]}
 
     @property
     def unique_columns(self):
-        return {test["test_metadata"]["kwargs"]["column_name"]
-                for test in self.unique_tests.values()}
+        if self._unique_columns is None:
+            self._unique_columns = self.project._columns_by_model_and_type.get(
+                (self.unique_id, "unique"), frozenset())
+        return self._unique_columns
 
     @property
     def not_null_columns(self):
-        return {test["test_metadata"]["kwargs"]["column_name"]
-                for test in self.not_null_tests.values()}
+        if self._not_null_columns is None:
+            self._not_null_columns = self.project._columns_by_model_and_type.get(
+                (self.unique_id, "not_null"), frozenset())
+        return self._not_null_columns
 
     def get_mermaid(self):
-        mermaid_elements = [f"{self['name']} {{"]
-        mermaid_elements += [column.get_mermaid()
-                             for column in self.columns.values()]
-        mermaid_elements.append("}")
-        mermaid = "\n".join(mermaid_elements)
-        return mermaid
+        return "\n".join(self.iter_mermaid())
+
+    def iter_mermaid(self):
+        # Same output as Column.get_mermaid, read straight from the catalog
+        unique_columns = self.unique_columns
+        not_null_columns = self.not_null_columns
+        yield f"{self['name']} {{"
+        for name, column in self.catalog["columns"].items():
+            column_type = clean_property(column["type"])
+            column_name = clean_property(column["name"])
+            pk_marker = " PK" if name in unique_columns and name in not_null_columns else ""
+            yield f"{TAB}{column_type} {column_name}{pk_marker}"
+        yield "}"
 
     @property
     def tests(self):
-        return {k: test for k, test in self.project.tests.items()
-                if self.unique_id in test["depends_on"]["nodes"]}
+        return {k: self.project.test(k)
+                for k in self.project._tests_by_model.get(self.unique_id, [])}
 
     def is_related_test(self, node):
         return node.unique_id in self.tests
 
+    def get_tests_by_type(self, test_type):
+        """
+        Get the tests of a certain type (relationships, unique, not_null, etc.)
+        that depend on this model
+        """
+        return {k: self.project.test(k)
+                for k in self.project._tests_by_model_and_type.get((self.unique_id, test_type), [])}
+
     @property
     def unique_tests(self):
-        return {k: node for k, node in self.tests.items()
-                if node.is_unique_test}
+        return self.get_tests_by_type("unique")
 
     @property
     def not_null_tests(self):
-        return {k: node for k, node in self.tests.items()
-                if node.is_not_null_test}
+        return self.get_tests_by_type("not_null")
 
     def __repr__(self):
         return self["name"]
@@ -235,21 +541,28 @@ class Model(Node):
 @dataclass
 class Column:
     """A class to represent a column in a dbt model"""
+    __slots__ = ("name", "model", "_props")
+
     name: str
     model: Model
 
+    def __post_init__(self):
+        # Looked up on first access, since relationships use columns
+        # without reading the catalog
+        self._props = None
+
     def __getitem__(self, key):
-        return self.model.catalog["columns"][self.name][key]
+        if self._props is None:
+            self._props = self.model.catalog["columns"][self.name]
+        return self._props[key]
 
     def clean_property(self, property):
         """Clean a property according to mermaid specifications"""
-        cleaned_name = re.sub("^([^a-zA-Z])+", "", self[property])
-        cleaned_name = re.sub("([^a-zA-Z0-9_])+", "_", cleaned_name)
-        return cleaned_name
+        return clean_property(self[property])
 
-    def get_mermaid(self, indent=4):
+    def get_mermaid(self, indent=INDENT):
         """Get the mermaid representation"""
-        tab = " " * indent
+        tab = TAB if indent == INDENT else " " * indent
         column_type = self.clean_property("type")
         column_name = self.clean_property("name")
         pk_marker = " PK" if self.is_primary_key else ""
@@ -28,7 +28,21 @@ def cli():
     is_flag=True,
     default=False,
     help="Show the table fields in the diagram?")
-def erd(manifest_path, catalog_path, show_fields, nodes):
-    dbt = Dbt(manifest_path, catalog_path)
-    mermaid = dbt.get_mermaid(show_fields=show_fields, nodes=nodes)
-    click.echo(mermaid)
+@click.option(
+    "--low-memory/--no-low-memory",
+    envvar="DBT_MERMAID_LOW_MEMORY",
+    is_flag=True,
+    default=False,
+    help="Only load the selected nodes, using less memory but more time?")
+@click.option(
+    "--cache/--no-cache",
+    envvar="DBT_MERMAID_CACHE",
+    is_flag=True,
+    default=False,
+    help="Cache the parsed manifest between runs?")
+def erd(manifest_path, catalog_path, show_fields, low_memory, cache, nodes):
+    dbt = Dbt(manifest_path, catalog_path, select=nodes, low_memory=low_memory, cache=cache)
+    out = click.get_text_stream("stdout")
+    for line in dbt.iter_mermaid(show_fields=show_fields, nodes=nodes):
+        out.write(line)
+        out.write("\n")
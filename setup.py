@@ -9,6 +9,9 @@ setup(
     install_requires=[
         'Click',
     ],
+    extras_require={
+        'fast': ['orjson', 'ijson'],
+    },
     entry_points={
         'console_scripts': [
             'erd = erd.scripts.cli:erd',